@@ -3,9 +3,13 @@
 
 import json
 import argparse
+import posixpath
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from sklearn.metrics import accuracy_score, precision_score
@@ -13,10 +17,36 @@ try:
 except Exception:
     SKLEARN_AVAILABLE = False
 
+def _make_session(pool_size: int) -> requests.Session:
+    """
+    One pooled keep-alive session shared by all worker threads,
+    so each request reuses an open connection instead of a fresh handshake.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _batch_url(api_url: str) -> str:
+    """
+    The /predict_batch endpoint next to the given predict URL:
+    last path segment replaced, scheme/host/query kept.
+    """
+    parts = urlsplit(api_url)
+    path = posixpath.join(posixpath.dirname(parts.path.rstrip("/")) or "/", "predict_batch")
+    return urlunsplit(parts._replace(path=path))
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--api", default="http://localhost:8000/predict", help="FastAPI predict endpoint")
     parser.add_argument("--test", default="test_data.json", help="Path to test data JSON")
+    parser.add_argument("--batch-size", type=int, default=128,
+                        help="Items per request to the /predict_batch endpoint (server max 1024); "
+                             "1 sends each item to --api individually")
+    parser.add_argument("--batch-api", default=None,
+                        help="FastAPI batch endpoint (default: predict_batch next to the --api path)")
+    parser.add_argument("--workers", type=int, default=32, help="Max concurrent requests in flight")
     args = parser.parse_args()
 
     test_path = Path(args.test)
@@ -27,29 +57,60 @@ def main():
     with test_path.open("r", encoding="utf-8") as f:
         items = json.load(f)
 
-    y_true, y_pred = [], []
-    n_ok, n_fail = 0, 0
+    session = _make_session(pool_size=max(args.workers, 1))
 
-    for i, item in enumerate(items, start=1):
-        text = item["text"]
+    def post(item):
+        # Returns (true_label, prediction or None, error message or None)
         true_label = item["true_label"]
-
-        payload = {"text": text, "true_label": true_label}
+        payload = {"text": item["text"], "true_label": true_label}
         try:
-            r = requests.post(args.api, json=payload, timeout=10)
+            r = session.post(args.api, json=payload, timeout=10)
             r.raise_for_status()
             pred = r.json().get("sentiment")
             if pred is None:
-                print(f"[{i}] No 'sentiment' in response: {r.text}")
-                n_fail += 1
-                continue
-            y_true.append(true_label)
-            y_pred.append(pred)
-            n_ok += 1
+                return true_label, None, f"No 'sentiment' in response: {r.text}"
+            return true_label, pred, None
+        except Exception as e:
+            return true_label, None, f"Request failed: {e}"
+
+    batch_api = args.batch_api or _batch_url(args.api)
+
+    def post_batch(chunk):
+        # One request for the whole chunk; on failure every item in it is marked failed.
+        # A server without /predict_batch (404) falls back to per-item requests.
+        true_labels = [item["true_label"] for item in chunk]
+        payload = {"items": [{"text": item["text"], "true_label": item["true_label"]} for item in chunk]}
+        try:
+            r = session.post(batch_api, json=payload, timeout=30)
+            if r.status_code == 404:
+                return [post(item) for item in chunk]
+            r.raise_for_status()
+            preds = r.json().get("sentiments")
+            if not isinstance(preds, list) or len(preds) != len(chunk):
+                err = f"Bad 'sentiments' in batch response: {r.text}"
+                return [(t, None, err) for t in true_labels]
+            return [(t, p, None) for t, p in zip(true_labels, preds)]
         except Exception as e:
-            print(f"[{i}] Request failed: {e}")
-            n_fail += 1
+            return [(t, None, f"Batch request failed: {e}") for t in true_labels]
+
+    # The pool size bounds how many requests are in flight at once;
+    # ex.map yields results in input order.
+    with session, ThreadPoolExecutor(max_workers=max(args.workers, 1)) as ex:
+        if args.batch_size > 1:
+            chunks = [items[i:i + args.batch_size] for i in range(0, len(items), args.batch_size)]
+            results = [res for batch in ex.map(post_batch, chunks) for res in batch]
+        else:
+            results = list(ex.map(post, items))
+
+    # Split results in one pass each (no per-item appends), and print all
+    # failures in a single write once the pool has finished.
+    errs = [f"[{i}] {err}" for i, (_, _, err) in enumerate(results, start=1) if err is not None]
+    y_true = [t for t, _, err in results if err is None]
+    y_pred = [p for _, p, err in results if err is None]
+    n_ok, n_fail = len(y_true), len(errs)
 
+    if errs:
+        print("\n".join(errs))
     print(f"\nProcessed: {n_ok} ok, {n_fail} failed")
 
     # Accuracy
@@ -62,14 +62,20 @@
 
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import List, Literal
 from datetime import datetime, timezone
 import os
-import json
+# Pin BLAS/OpenMP to one thread per process before numpy/sklearn load (via joblib),
+# so each small predict doesn't spin up a thread pool that contends with the API workers.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+import asyncio
+import atexit
+from contextlib import asynccontextmanager
+import queue
+import time
 import joblib
-from threading import Lock
-
-app = FastAPI(title="Sentiment Analysis API")
+import orjson
+from threading import Lock, Thread
 
 # ---- Model loading ----
 MODEL_FILE = "sentiment_model.pkl"
@@ -88,25 +94,139 @@ _os_lock = Lock()
 def _ensure_log_dir():
     os.makedirs(LOG_DIR, exist_ok=True)
 
+# One long-lived append handle instead of open/write/close per request.
+_ensure_log_dir()
+# Records are encoded with orjson (UTF-8 bytes), so the handle is binary.
+_LOG_FH = open(os.path.join(LOG_DIR, LOG_FILE), "ab")
+
+# Request handlers only enqueue formatted lines; a single writer thread drains
+# everything queued so far and writes it in one go, keeping disk I/O off /predict.
+# When the queue is full: "block" waits for room, "drop" discards the record
+# (drops are counted and reported at most once per LOG_DROP_REPORT_S).
+# Logging is best-effort once queued: a failed disk write drops that chunk (no
+# retry), is printed, and is counted in _log_stats, which /health reports.
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "block")
+LOG_DROP_REPORT_S = 10.0
+_log_q = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_LOG_STOP = None  # sentinel that tells the writer to exit
+_log_stats = {"write_failures": 0, "records_lost": 0, "last_write_error": None, "dropped": 0}
+_log_drop_lock = Lock()
+_log_dropped = 0
+_log_drop_reported_at = 0.0
+
+# Optional linger: after the first record arrives, keep collecting for up to
+# LOG_FLUSH_MS so high-QPS bursts share one write() syscall. 0 = flush immediately.
+LOG_FLUSH_S = float(os.getenv("LOG_FLUSH_MS", "0")) / 1000.0
+
+def _log_writer():
+    stop = False
+    while not stop:
+        item = _log_q.get()
+        if item is _LOG_STOP:
+            break
+        batch = [item]
+        deadline = time.monotonic() + LOG_FLUSH_S
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = _log_q.get(timeout=remaining)
+                else:
+                    item = _log_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _LOG_STOP:
+                stop = True
+                break
+            batch.append(item)
+        chunk = b"".join(batch)
+        try:
+            with _os_lock:
+                _LOG_FH.write(chunk)
+                _LOG_FH.flush()
+        except Exception as e:
+            lost = chunk.count(b"\n")
+            _log_stats["write_failures"] += 1
+            _log_stats["records_lost"] += lost
+            _log_stats["last_write_error"] = f"{type(e).__name__}: {e}"
+            print(f"Error: failed to write prediction log, dropped {lost} record(s): {e}")
+
+_log_thread = Thread(target=_log_writer, name="prediction-log-writer", daemon=True)
+_log_thread.start()
+
+def _count_dropped_log() -> None:
+    global _log_dropped, _log_drop_reported_at
+    with _log_drop_lock:
+        _log_dropped += 1
+        _log_stats["dropped"] += 1
+        now = time.monotonic()
+        if now - _log_drop_reported_at < LOG_DROP_REPORT_S:
+            return
+        dropped, _log_dropped, _log_drop_reported_at = _log_dropped, 0, now
+    print(f"Warning: prediction log queue full, dropped {dropped} record chunk(s).")
+
+def _enqueue_log(chunk: bytes) -> None:
+    """
+    Hand complete log lines to the writer thread, per LOG_QUEUE_POLICY.
+    Doesn't wait for the write: if it later fails, the chunk is dropped
+    (not retried) and counted in _log_stats rather than failing this request.
+    """
+    if LOG_QUEUE_POLICY == "drop":
+        try:
+            _log_q.put_nowait(chunk)
+        except queue.Full:
+            _count_dropped_log()
+    else:
+        _log_q.put(chunk)
+
+def _close_log():
+    # Flush whatever is still queued before the handle goes away
+    _log_q.put(_LOG_STOP)
+    _log_thread.join(timeout=5)
+    _LOG_FH.close()
+
+atexit.register(_close_log)
+
 def _utc_timestamp() -> str:
     return datetime.now(timezone.utc).isoformat()
 
-def _log_prediction(request_text: str, predicted_sentiment: str, true_label: str) -> None:
+def _encode_log_line(timestamp: str, request_text: str, predicted_sentiment: str, true_label: str) -> bytes:
     """
-    Append a single-line JSON object to logs/prediction_logs.json.
+    One NDJSON line for a prediction. Raises orjson.JSONEncodeError for text
+    that can't be written as UTF-8 (e.g. a lone surrogate).
     """
-    _ensure_log_dir()
     record = {
-        "timestamp": _utc_timestamp(),
+        "timestamp": timestamp,
         "request_text": request_text,
         "predicted_sentiment": predicted_sentiment,
         "true_label": true_label,
     }
-    line = json.dumps(record, ensure_ascii=False)
-    # Use a lock to avoid interleaving writes under concurrency
-    with _os_lock:
-        with open(os.path.join(LOG_DIR, LOG_FILE), "a", encoding="utf-8") as f:
-            f.write(line + "\n")
+    return orjson.dumps(record) + b"\n"
+
+def _log_prediction(request_text: str, predicted_sentiment: str, true_label: str) -> None:
+    """
+    Queue a single-line JSON object for logs/prediction_logs.json.
+    """
+    _enqueue_log(_encode_log_line(_utc_timestamp(), request_text, predicted_sentiment, true_label))
+
+def _log_predictions(request_texts: List[str], predicted: List[str], true_labels: List[str]) -> list:
+    """
+    Queue one JSON line per prediction, as a single chunk for the whole batch.
+    Each record is encoded on its own: returns a per-item list of encode errors
+    (None where the line was queued), so one bad record doesn't fail the others.
+    """
+    ts = _utc_timestamp()
+    lines, errors = [], []
+    for text, pred, label in zip(request_texts, predicted, true_labels):
+        try:
+            lines.append(_encode_log_line(ts, text, pred, label))
+            errors.append(None)
+        except orjson.JSONEncodeError as e:
+            errors.append(e)
+    if lines:
+        _enqueue_log(b"".join(lines))
+    return errors
 
 # ---- Request schema ----
 class PredictionInput(BaseModel):
@@ -116,13 +236,114 @@ class PredictionInput(BaseModel):
         ..., description="User-provided ground truth label for this text"
     )
 
-# ---- Endpoint ----
+BATCH_ITEMS_MAX = 1024  # upper bound on one /predict_batch request (predict + log chunk size)
+
+class BatchInput(BaseModel):
+    items: List[PredictionInput] = Field(
+        ..., max_length=BATCH_ITEMS_MAX, description="Texts (with true labels) to classify together"
+    )
+
+# ---- Micro-batching ----
+# Concurrent /predict calls are queued and coalesced: the worker waits up to
+# BATCH_WINDOW_S (or until BATCH_MAX requests are queued) and then runs one
+# model.predict over the whole batch, logging it with a single write.
+BATCH_MAX = int(os.getenv("PREDICT_BATCH_MAX", "64"))
+BATCH_WINDOW_S = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5")) / 1000.0
+_predict_queue = None  # asyncio.Queue of (text, true_label, future), created at startup
+
+def _predict_and_log(texts: List[str], true_labels: List[str]):
+    """
+    Runs in a worker thread. Returns (predictions, per-item logging error or None)
+    so a record that can't be logged only fails its own request.
+    """
+    predicted = [str(p) for p in model.predict(texts)]
+    try:
+        log_errors = _log_predictions(request_texts=texts, predicted=predicted, true_labels=true_labels)
+    except Exception as e:
+        log_errors = [e] * len(texts)
+    return predicted, log_errors
+
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _predict_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_S
+        while len(batch) < BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_predict_queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        texts = [text for text, _, _ in batch]
+        labels = [label for _, label, _ in batch]
+        try:
+            predicted, log_errors = await loop.run_in_executor(None, _predict_and_log, texts, labels)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for (_, _, fut), pred, log_error in zip(batch, predicted, log_errors):
+            if not fut.done():
+                fut.set_result((pred, log_error))
+
+def _warm_model():
+    # One throwaway prediction (not logged) so the first real request doesn't pay
+    # for lazy imports and first-use allocations in the sklearn pipeline.
+    if model is not None:
+        model.predict(["warmup"])
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Warm the model and start the micro-batch worker; on shutdown cancel the
+    # worker and wait for it to exit
+    global _predict_queue
+    _warm_model()
+    _predict_queue = asyncio.Queue()
+    worker = asyncio.create_task(_batch_worker())
+    try:
+        yield
+    finally:
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+
+app = FastAPI(title="Sentiment Analysis API", lifespan=_lifespan)
+
+async def _submit(text: str, true_label: str):
+    """
+    Queue one text for the next micro-batch and wait for (prediction, logging error).
+    """
+    fut = asyncio.get_running_loop().create_future()
+    await _predict_queue.put((text, true_label, fut))
+    return await fut
+
+# ---- Endpoints ----
+@app.get("/health")
+def health_check():
+    """
+    Liveness plus prediction-log health: write failures and records lost in
+    the background writer, and records dropped on a full queue.
+    """
+    return {
+        "status": "ok",
+        "model_loaded": model is not None,
+        "log": dict(_log_stats),
+    }
+
 @app.post("/predict")
-def predict(input_data: PredictionInput):
+async def predict(input_data: PredictionInput):
     """
     Takes text and a user-provided true_label, returns model prediction,
     and logs {timestamp, request_text, predicted_sentiment, true_label}
     to logs/prediction_logs.json (one JSON object per line).
+    Logging is asynchronous and best-effort: a 500 means this request's record
+    couldn't be encoded; later disk-write failures are reported by /health.
     """
 
     print(f"[BOOT] Using PredictionInput fields: text, true_label")
@@ -133,25 +354,52 @@ def predict(input_data: PredictionInput):
             detail="Model is not loaded. Cannot make predictions."
         )
 
-    # Model expects an iterable of texts
-    prediction = model.predict([input_data.text])
-    predicted = str(prediction[0])
+    # Prediction and logging (always) happen in the shared micro-batch
+    predicted, log_error = await _submit(input_data.text, input_data.true_label)
 
-    # Log the event (always)
-    try:
-        _log_prediction(
-            request_text=input_data.text,
-            predicted_sentiment=predicted,
-            true_label=input_data.true_label,
+    if log_error is not None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to write prediction log: {log_error}"
+        )
+
+    return {"sentiment": predicted}
+
+@app.post("/predict_batch")
+def predict_batch(input_data: BatchInput):
+    """
+    Same as /predict but for many items at once: runs a single model.predict
+    over all texts and logs every item in one write.
+    Returns {"sentiments": [...]} in the same order as the input items.
+    """
+    if model is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Model is not loaded. Cannot make predictions."
         )
+
+    if not input_data.items:
+        return {"sentiments": []}
+
+    texts = [item.text for item in input_data.items]
+    predicted = [str(p) for p in model.predict(texts)]
+
+    # Encode every record before queueing any, so a bad item fails the request
+    # without leaving the rest of the batch half-logged.
+    ts = _utc_timestamp()
+    try:
+        lines = [
+            _encode_log_line(ts, text, pred, item.true_label)
+            for text, pred, item in zip(texts, predicted, input_data.items)
+        ]
+        _enqueue_log(b"".join(lines))
     except Exception as e:
-        # If logging fails, still return a prediction
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to write prediction log: {e}"
         )
 
-    return {"sentiment": predicted}
+    return {"sentiments": predicted}
 
 
 # Can now run in terminal: uvicorn main:app --reload
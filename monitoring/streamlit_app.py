@@ -2,15 +2,21 @@
 # Minimal monitoring dashboard with submit box in sidebar
 
 from pathlib import Path
-import json
+from threading import Lock
+import io
 import os
+import tempfile
 from typing import List
 import re
 import altair as alt
 
 import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 import matplotlib.pyplot as plt
 
@@ -37,66 +43,267 @@ API_URL = os.getenv("API_URL", "http://sentiment_api:8000/predict")
 # -----------------------
 # Helpers
 # -----------------------
-WORD_RE = re.compile(r"\b\w+\b", flags=re.UNICODE)
+# A maximal \w+ run is always bounded by \b on both sides, so the explicit
+# \b...\b assertions are redundant work for the matcher; \w+ counts the same tokens.
+WORD_RE = re.compile(r"\w+", flags=re.UNICODE)
 
 def token_len_series(text_series: pd.Series) -> pd.Series:
     # Robust token count: counts word-like tokens (letters/numbers/underscore)
     # Avoids empty/HTML edge cases better than simple .split()
+    # Vectorized via .str.count instead of a per-row Python lambda. Pinned to
+    # python-backed strings: Arrow storage would send the count to RE2, where \w
+    # is ASCII-only and non-ASCII reviews would get different token counts.
     return (
         text_series.fillna("")
-        .astype(str)
-        .map(lambda s: len(WORD_RE.findall(s)))
-        .astype(int)
+        .astype(pd.StringDtype("python"))
+        .str.count(WORD_RE.pattern, flags=WORD_RE.flags)
+        .astype("int32")
     )
 
-@st.cache_data(show_spinner=False)
-def load_logs(ndjson_path: Path) -> pd.DataFrame:
-    if not ndjson_path.exists():
-        return pd.DataFrame(columns=["timestamp","request_text","predicted_sentiment","true_label"])
+LOG_COLUMNS = ["timestamp", "request_text", "predicted_sentiment", "true_label"]
+# Text column dtype for every parsed chunk, so chunks from either parser
+# concat without falling back to object columns
+ARROW_STRING = pd.ArrowDtype(pa.string())
 
+def _parse_log_lines(data: bytes) -> pd.DataFrame:
+    # Slow path: line-by-line parse that skips malformed/partial lines
     rows: List[dict] = []
-    with ndjson_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rows.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-
-    df = pd.DataFrame(rows)
-    if "timestamp" in df:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rows.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            continue
+    return pd.DataFrame(rows)
+
+def _parse_log_bytes(data: bytes) -> pd.DataFrame:
+    # Parse a chunk of NDJSON with pyarrow's multithreaded JSON reader
+    # (about 3x faster than the default pandas engine, about 2x faster than
+    # orjson per line). Fall back to the tolerant line-by-line parser if any
+    # line is malformed (pyarrow raises ArrowInvalid, a ValueError).
+    try:
+        df = pd.read_json(io.BytesIO(data), lines=True, engine="pyarrow", dtype_backend="pyarrow")
+    except ValueError:
+        df = _parse_log_lines(data)
+    # Pin dtypes per chunk: pyarrow infers them from the chunk itself (e.g. an
+    # all-null column), and concatenated chunks have to agree.
     for col in ["request_text", "predicted_sentiment", "true_label"]:
         if col in df:
-            df[col] = df[col].astype("string")
+            df[col] = df[col].astype(ARROW_STRING)
+    if "timestamp" in df:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+    # Normalized prediction for the target-drift panel, computed once per new chunk
+    if "predicted_sentiment" in df:
+        df["_predicted_label"] = df["predicted_sentiment"].str.lower().str.strip()
     return df
 
-@st.cache_data(show_spinner=False)
-def load_imdb(csv_path: Path) -> pd.DataFrame:
+@st.cache_resource(show_spinner=False)
+def _log_tail_state(ndjson_path: Path) -> dict:
+    # Shared across reruns/sessions: how far into the file we've parsed, and the result so far
+    state = {"offset": 0, "version": 0, "lock": Lock()}
+    _set_log_df(state, pd.DataFrame(columns=LOG_COLUMNS))
+    return state
+
+def _set_log_df(state: dict, df: pd.DataFrame) -> None:
+    # Every new DataFrame gets a fresh version in df.attrs["log_version"],
+    # a cheap cache key that changes exactly when the parsed logs change.
+    state["version"] += 1
+    df.attrs["log_version"] = state["version"]
+    state["df"] = df
+
+def load_logs(ndjson_path: Path) -> pd.DataFrame:
+    """
+    Return all log entries, parsing only the bytes appended since the last call.
+    The returned DataFrame is shared between reruns: treat it as read-only.
+    """
+    state = _log_tail_state(ndjson_path)
+    with state["lock"]:
+        size = ndjson_path.stat().st_size if ndjson_path.exists() else 0
+        if size < state["offset"]:
+            # File was truncated or replaced: start over
+            state["offset"] = 0
+            _set_log_df(state, pd.DataFrame(columns=LOG_COLUMNS))
+        if size == state["offset"]:
+            return state["df"]
+
+        with ndjson_path.open("rb") as f:
+            f.seek(state["offset"])
+            new = f.read(size - state["offset"])
+        # Only consume complete lines; a partly written last line is picked up next time
+        end = new.rfind(b"\n") + 1
+        if end == 0:
+            return state["df"]
+        state["offset"] += end
+
+        new_df = _parse_log_bytes(new[:end])
+        if not new_df.empty:
+            if state["df"].empty:
+                _set_log_df(state, new_df)
+            else:
+                _set_log_df(state, pd.concat([state["df"], new_df], ignore_index=True))
+        return state["df"]
+
+def _atomic_to_parquet(df: pd.DataFrame, path: Path, metadata: dict = None) -> None:
+    # Write to a temp file in the same directory and rename it into place, so a
+    # killed process never leaves a truncated Parquet file at the final path.
+    # Optional metadata (str -> str) is stored in the Parquet schema.
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        merged = dict(table.schema.metadata or {})
+        merged.update({k.encode(): v.encode() for k, v in metadata.items()})
+        table = table.replace_schema_metadata(merged)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _imdb_parquet(csv_path: Path):
+    """
+    Path of the Parquet copy of the IMDB CSV, (re)converting it when it's missing
+    or older than the CSV. Returns None if neither is usable.
+    """
+    parquet_path = csv_path.with_suffix(".parquet")
     if not csv_path.exists():
-        return pd.DataFrame(columns=["review","sentiment"])
-    return pd.read_csv(csv_path)
+        return parquet_path if parquet_path.exists() else None
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return parquet_path
+    try:
+        _atomic_to_parquet(pd.read_csv(csv_path), parquet_path)
+    except Exception:
+        return None  # e.g. read-only location: callers read the CSV instead
+    return parquet_path
+
+def _read_imdb_column(csv_path: Path, column: str) -> pd.DataFrame:
+    # Read a single column: memory-mapped from Parquet, else straight from the CSV
+    parquet_path = _imdb_parquet(csv_path)
+    if parquet_path is not None:
+        try:
+            table = pq.read_table(parquet_path, columns=[column], memory_map=True)
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        except Exception:
+            pass  # unreadable copy: fall back to the CSV
+    if csv_path.exists():
+        return pd.read_csv(csv_path, usecols=[column])
+    return pd.DataFrame(columns=[column])
+
+@st.cache_resource(show_spinner=False)
+def load_imdb_labels(csv_path: Path) -> pd.DataFrame:
+    """
+    IMDB "sentiment" column only (the review text is never loaded), plus a
+    categorical "_label" column (lower-cased, stripped sentiment) for the
+    target-drift panel. Shared between reruns and sessions: treat as read-only.
+    """
+    df = _read_imdb_column(csv_path, "sentiment")
+    df["_label"] = df["sentiment"].astype("string").str.lower().str.strip().astype("category")
+    return df
+
+def load_imdb_reviews(csv_path: Path) -> pd.Series:
+    # Not cached: only needed once, to build the token-length artifact below
+    return _read_imdb_column(csv_path, "review")["review"]
+
+# Bump when token_len_series changes in a way WORD_RE.pattern/flags don't capture
+LENGTHS_VERSION = "1"
+LENGTHS_KEY_FIELD = "imdb_lengths_key"
+
+def _imdb_lengths_key(csv_path: Path):
+    # Identifies the inputs the persisted lengths were computed from
+    if not csv_path.exists():
+        return None
+    csv_stat = csv_path.stat()
+    return orjson.dumps({
+        "csv_mtime_ns": csv_stat.st_mtime_ns,
+        "csv_size": csv_stat.st_size,
+        "pattern": WORD_RE.pattern,
+        "flags": int(WORD_RE.flags),
+        "version": LENGTHS_VERSION,
+    }).decode()
+
+@st.cache_resource(show_spinner=False)
+def load_imdb_lengths(csv_path: Path) -> pd.Series:
+    """
+    Token length of every IMDB review, computed once and persisted as a Parquet
+    artifact next to the dataset so the regex never reruns on a refresh.
+    The artifact records the CSV mtime/size and tokenizer it was built from and
+    is rebuilt when any of them change. Shared between reruns: treat as read-only.
+    """
+    lengths_path = csv_path.with_name(csv_path.stem + " lengths.parquet")
+    key = _imdb_lengths_key(csv_path)
+    if lengths_path.exists():
+        try:
+            stored = (pq.read_schema(lengths_path).metadata or {}).get(LENGTHS_KEY_FIELD.encode())
+            if key is None or (stored is not None and stored.decode() == key):
+                return pd.read_parquet(lengths_path)["length"]
+        except Exception:
+            pass  # unreadable artifact: rebuild it below
+
+    reviews = load_imdb_reviews(csv_path)
+    if reviews.empty:
+        return pd.Series(dtype="int32", name="length")
+    lengths = token_len_series(reviews).rename("length")
+    if key is not None:
+        try:
+            _atomic_to_parquet(lengths.to_frame(), lengths_path, metadata={LENGTHS_KEY_FIELD: key})
+        except Exception:
+            pass  # e.g. read-only location: keep the in-memory copy only
+    return lengths
 
 def sentence_lengths(text_series: pd.Series) -> pd.Series:
-    return text_series.fillna("").astype(str).str.split().map(len)
+    return text_series.fillna("").astype("string").str.split().str.len()
+
+def _encode_labels(true_labels, pred_labels):
+    # Integer-encode both label arrays against their shared set of classes
+    t = np.asarray(true_labels, dtype=object)
+    p = np.asarray(pred_labels, dtype=object)
+    codes, classes = pd.factorize(np.concatenate([t, p]), sort=True)
+    return codes[:len(t)], codes[len(t):], len(classes)
 
 def safe_precision(true_labels, pred_labels) -> float:
     if SKLEARN_AVAILABLE:
         return float(precision_score(true_labels, pred_labels, average="macro", zero_division=0))
-    classes = sorted(set(true_labels) | set(pred_labels))
-    vals = []
-    for c in classes:
-        tp = sum((pred_labels == c) & (true_labels == c))
-        fp = sum((pred_labels == c) & (true_labels != c))
-        vals.append(tp / (tp + fp) if (tp + fp) > 0 else 0.0)
-    return float(np.mean(vals)) if vals else 0.0
+    t_codes, p_codes, k = _encode_labels(true_labels, pred_labels)
+    if k == 0:
+        return 0.0
+    # Confusion matrix in one pass: rows = true, cols = predicted
+    cm = np.zeros((k, k), dtype=np.int64)
+    np.add.at(cm, (t_codes, p_codes), 1)
+    tp = np.diag(cm)
+    predicted = cm.sum(axis=0)  # tp + fp per class
+    prec = np.divide(tp, predicted, out=np.zeros(k, dtype=float), where=predicted > 0)
+    return float(prec.mean())
 
 def safe_accuracy(true_labels, pred_labels) -> float:
     if SKLEARN_AVAILABLE:
         return float(accuracy_score(true_labels, pred_labels))
-    return float(np.mean((true_labels == pred_labels).astype(float))) if len(true_labels) else 0.0
+    if not len(true_labels):
+        return 0.0
+    t_codes, p_codes, _ = _encode_labels(true_labels, pred_labels)
+    return float((t_codes == p_codes).mean())
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def compute_metrics(log_version: int, _true_labels: pd.Series, _pred_labels: pd.Series) -> dict:
+    """
+    Accuracy, macro precision and (if sklearn is available) the classification
+    report. Cached on log_version only (the underscore arguments aren't hashed),
+    so reruns with unchanged logs skip both the recompute and any O(N) hashing.
+    """
+    t = np.asarray(_true_labels, dtype=object)
+    p = np.asarray(_pred_labels, dtype=object)
+    report = classification_report(t, p, zero_division=0) if SKLEARN_AVAILABLE else None
+    return {"accuracy": safe_accuracy(t, p), "precision": safe_precision(t, p), "report": report}
+
+@st.cache_resource(show_spinner=False)
+def _session() -> requests.Session:
+    # One keep-alive connection pool to the API, reused across submits
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+    return s
 
 # -----------------------
 # Sidebar: Submit new review
@@ -113,7 +320,7 @@ true_label = st.sidebar.selectbox("True label", options=label_options, index=lab
 if st.sidebar.button("Submit"):
     payload = {"text": new_text, "true_label": true_label}
     try:
-        r = requests.post(API_URL, json=payload, timeout=10)
+        r = _session().post(API_URL, json=payload, timeout=10)
         r.raise_for_status()
         pred = r.json().get("sentiment", "")
         correct = (pred == true_label)
@@ -121,8 +328,7 @@ if st.sidebar.button("Submit"):
         st.session_state["last_correct"] = bool(correct)
         st.session_state["last_text"] = new_text
         st.session_state["last_true_label"] = true_label
-        # refresh logs cache and rerun to update charts
-        load_logs.clear()
+        # rerun to update charts (load_logs picks up the new log lines)
         st.rerun()
     except Exception as e:
         st.sidebar.error(f"Submission failed: {e}")
@@ -143,7 +349,7 @@ if "last_prediction" in st.session_state:
 st.title("Sentiment Monitoring Dashboard")
 
 logs_df = load_logs(LOG_FILE)
-imdb_df = load_imdb(IMDB_CSV)
+imdb_df = load_imdb_labels(IMDB_CSV)
 
 if logs_df.empty:
     st.warning("No logs found yet. Submit a review on the left to generate logs.")
@@ -156,41 +362,37 @@ else:
     st.info(f"Loaded IMDB dataset with {len(imdb_df):,} rows.")
 
 # -----------------------
-# Data Drift: sentence length distributions (single overlaid density chart)
+# Data Drift: sentence length distributions (single overlaid histogram-density chart)
 # -----------------------
 st.header("Data Drift: Sentence Length Distribution")
 
-IMDB_TEXT_COL = "review"
+imdb_lengths = load_imdb_lengths(IMDB_CSV)
 
 if (
-    not imdb_df.empty and IMDB_TEXT_COL in imdb_df.columns
+    not imdb_lengths.empty
     and not logs_df.empty and "request_text" in logs_df
 ):
-    imdb_lengths = token_len_series(imdb_df[IMDB_TEXT_COL]).rename("length").to_frame()
-    imdb_lengths["source"] = "Training (IMDB)"
-
-    live_lengths = token_len_series(logs_df["request_text"]).rename("length").to_frame()
-    live_lengths["source"] = "Live Inference"
-
-    both = pd.concat([imdb_lengths, live_lengths], ignore_index=True)
+    live_lengths = token_len_series(logs_df["request_text"])
 
     # Cap display at the shared 99th percentile to avoid long-tail squashing
     cap = int(np.nanmax([
-        imdb_lengths["length"].quantile(0.99),
-        live_lengths["length"].quantile(0.99),
+        imdb_lengths.quantile(0.99),
+        live_lengths.quantile(0.99),
         1
     ]))
 
-    base = alt.Chart(both)
+    # Histogram densities are computed here, so the chart gets a fixed-size
+    # summary (120 bins per source) instead of every raw length to run KDE on.
+    bins = np.linspace(0, cap, 121)
+    centers = 0.5 * (bins[1:] + bins[:-1])
+    rows = []
+    for src, lengths in [("Training (IMDB)", imdb_lengths), ("Live Inference", live_lengths)]:
+        hist, _ = np.histogram(lengths.to_numpy(), bins=bins, density=True)
+        rows.append(pd.DataFrame({"length": centers, "density": hist, "source": src}))
+    both = pd.concat(rows, ignore_index=True)
 
     density = (
-        base.transform_density(
-            density="length",
-            groupby=["source"],
-            as_=["length", "density"],
-            extent=[0, cap],
-            steps=120,
-        )
+        alt.Chart(both)
         .mark_area(opacity=0.45)
         .encode(
             x=alt.X(
@@ -218,23 +420,19 @@ else:
 # -----------------------
 st.header("Target Drift: Label Distribution")
 
-IMDB_LABEL_COL = "sentiment"
-
 if (
-    not imdb_df.empty and IMDB_LABEL_COL in imdb_df.columns
-    and not logs_df.empty and "predicted_sentiment" in logs_df
+    not imdb_df.empty and "_label" in imdb_df.columns
+    and not logs_df.empty and "_predicted_label" in logs_df
 ):
     train = (
-        imdb_df[IMDB_LABEL_COL]
-        .astype("string").str.lower().str.strip()
+        imdb_df["_label"]
         .value_counts(normalize=True)
         .rename_axis("label").reset_index(name="proportion")
     )
     train["source"] = "Training"
 
     live = (
-        logs_df["predicted_sentiment"]
-        .astype("string").str.lower().str.strip()
+        logs_df["_predicted_label"]
         .value_counts(normalize=True)
         .rename_axis("label").reset_index(name="proportion")
     )
@@ -248,14 +446,13 @@ if (
     if not present:  # safety
         present = sorted(drift_df["label"].unique())
 
-    # Ensure both sources have all labels (fill missing with 0)
-    for lab in present:
-        for src in ("Training", "Live"):
-            if not ((drift_df["label"] == lab) & (drift_df["source"] == src)).any():
-                drift_df = pd.concat(
-                    [drift_df, pd.DataFrame([{"label": lab, "proportion": 0.0, "source": src}])],
-                    ignore_index=True,
-                )
+    # Ensure both sources have all labels (fill missing with 0) in one reindex
+    idx = pd.MultiIndex.from_product([["Training", "Live"], present], names=["source", "label"])
+    drift_df = (
+        drift_df.set_index(["source", "label"])
+        .reindex(idx, fill_value=0.0)
+        .reset_index()
+    )
 
     drift_df["label"] = pd.Categorical(drift_df["label"], categories=present, ordered=True)
 
@@ -290,8 +487,11 @@ if not logs_df.empty and {"predicted_sentiment", "true_label"}.issubset(set(logs
     if len(labeled) == 0:
         st.info("No user feedback available in logs yet.")
     else:
-        acc = safe_accuracy(labeled["true_label"], labeled["predicted_sentiment"])
-        prec = safe_precision(labeled["true_label"], labeled["predicted_sentiment"])
+        metrics = compute_metrics(
+            logs_df.attrs["log_version"], labeled["true_label"], labeled["predicted_sentiment"]
+        )
+        acc = metrics["accuracy"]
+        prec = metrics["precision"]
 
         if acc < 0.80:
             st.error(f"Warning: Accuracy below threshold — {acc:.2%}")
@@ -303,6 +503,6 @@ if not logs_df.empty and {"predicted_sentiment", "true_label"}.issubset(set(logs
 
         if SKLEARN_AVAILABLE:
             st.text("Classification Report:")
-            st.code(classification_report(labeled["true_label"], labeled["predicted_sentiment"], zero_division=0))
+            st.code(metrics["report"])
 else:
     st.info("Waiting for logged feedback to compute metrics.")
\ No newline at end of file